@@ -3,23 +3,58 @@
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 # Copyright (c) 2014 Mozilla Corporation
 
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from datetime import datetime
 from enum import Enum
 import json
 import os
+import threading
+import time
 import typing as types
 from urllib.parse import urljoin
 
 import boto3
+import botocore.config
+import botocore.exceptions
 import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 from requests_jwt import JWTAuth
 
 from mozdef_util.utilities.logger import logger
 from mozdef_util.utilities.toUTC import toUTC
 
+# orjson is optional.  When available it is used in place of the standard
+# library to parse and serialize JSON, which it does considerably faster.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 CONFIG_FILE = os.path.join(os.path.dirname(__file__), "triage_bot.json")
 
+# How long before the OAuth token is due to expire that it should be refreshed
+# in the background, and the minimum time to wait between refresh attempts.
+TOKEN_REFRESH_MARGIN_SECONDS = 5 * 60
+MIN_TOKEN_REFRESH_INTERVAL_SECONDS = 60
+
+# User profiles retrieved from the Person API are cached for an hour.  Users
+# that do not exist are cached briefly so that we do not hammer the API for
+# bad names.
+USER_CACHE_MAX_SIZE = 4096
+USER_CACHE_TTL_SECONDS = 60 * 60
+USER_CACHE_NEGATIVE_TTL_SECONDS = 60
+
+# (connect, read) timeouts applied to requests made to the Person API and to
+# the MozDef REST API.  Alerts are triaged inline, so every request must be
+# bounded for a slow API not to stall the alert actions worker.
+PERSON_API_TIMEOUT = (3, 10)
+REST_API_TIMEOUT = (3, 10)
+
+# Retry Lambda calls that fail due to throttling or transient errors.
+LAMBDA_CLIENT_CONFIG = botocore.config.Config(retries={"max_attempts": 3})
+
 
 Alert = types.Dict[types.Any, types.Any]
 Email = str
@@ -53,21 +88,24 @@ class Confidence(Enum):
 class Config(types.NamedTuple):
     """Container type for the configuration parameters required by the
     alert action.
+
+    The `message` class clears the credential fields to `None` once it has
+    used them.
     """
 
-    enabled_alert_classnames: types.List[str]
+    enabled_alert_classnames: types.Collection[str]
     oauth_url: str
     person_api_base: str
     person_api_audience: str
     person_api_scope: str
     person_api_grants: str
     token_validity_window_minutes: int
-    person_api_client_id: str
-    person_api_client_secret: str
+    person_api_client_id: types.Optional[str]
+    person_api_client_secret: types.Optional[str]
     slack_bot_function_name_prefix: str
     l_fn_name_validity_window_seconds: int
-    aws_access_key_id: str
-    aws_secret_access_key: str
+    aws_access_key_id: types.Optional[str]
+    aws_secret_access_key: types.Optional[str]
     aws_region: str
     aws_lambda_function: str
     mozdef_restapi_url: str
@@ -84,6 +122,19 @@ class AlertTriageRequest(types.NamedTuple):
     user: Email
     identityConfidence: Confidence
 
+    def to_bytes(self) -> bytes:
+        """Serializes the request to the JSON payload expected by the lambda
+        function.
+        """
+
+        return _json_dumps({
+            "identifier": self.identifier,
+            "alert": self.alert.value,
+            "summary": self.summary,
+            "user": self.user,
+            "identityConfidence": self.identityConfidence.value,
+        })
+
 
 class AuthParams(types.NamedTuple):
     """Configuration parameters required to authenticate using OAuth in order
@@ -110,6 +161,56 @@ class User(types.NamedTuple):
     mozilla_ldap_primary_email: str
 
 
+class UserCache(object):
+    """A thread-safe, size-bounded LRU cache of the results of user profile
+    lookups, including lookups of users that do not exist, each of which
+    expires after a TTL.
+    """
+
+    def __init__(
+        self,
+        max_size: int = USER_CACHE_MAX_SIZE,
+        ttl: float = USER_CACHE_TTL_SECONDS,
+        negative_ttl: float = USER_CACHE_NEGATIVE_TTL_SECONDS,
+    ):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, uname: str) -> types.Tuple[bool, types.Optional[User]]:
+        """Returns a pair of a boolean indicating whether an unexpired entry
+        was found for `uname` and the (possibly `None`) cached profile.
+        """
+
+        with self._lock:
+            entry = self._entries.get(uname)
+
+            if entry is None:
+                return (False, None)
+
+            expires, profile = entry
+
+            if time.monotonic() >= expires:
+                del self._entries[uname]
+                return (False, None)
+
+            self._entries.move_to_end(uname)
+
+            return (True, profile)
+
+    def put(self, uname: str, profile: types.Optional[User]):
+        ttl = self._ttl if profile is not None else self._negative_ttl
+
+        with self._lock:
+            self._entries[uname] = (time.monotonic() + ttl, profile)
+            self._entries.move_to_end(uname)
+
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+
 class LambdaFunction(types.NamedTuple):
     """Contains information identifying lambda functions visible to the owner
     of a boto session that calls an implementation of a `DiscoveryInterface`.
@@ -159,6 +260,27 @@ class AuthFailure(Exception):
         super().__init__("Failed to authenticate to the Person API")
 
 
+class Unauthorized(Exception):
+    """Raised by `primary_username` in the case that the Person API rejects
+    the OAuth token provided, indicating that a new token must be obtained.
+    """
+
+    def __init__(self):
+        super().__init__("Person API rejected the OAuth token provided")
+
+
+class LookupFailure(Exception):
+    """Raised by `primary_username` in the case that the Person API cannot be
+    reached or fails to respond with a profile, as opposed to reporting that
+    a user does not exist.
+    """
+
+    def __init__(self, err_msg):
+        super().__init__(err_msg)
+
+        self.message = err_msg
+
+
 class DiscoveryFailure(Exception):
     """Raised by the `message` class in the case that discovery of the
     appropriate Lambda function to invoke (whose name changes when it's
@@ -179,6 +301,46 @@ class APIError(Exception):
         self.message = err_msg
 
 
+def _json_loads(data: types.Union[bytes, str]) -> types.Any:
+    """Deserializes JSON, raising `ValueError` if it is malformed.
+    """
+
+    if orjson is not None:
+        return orjson.loads(data)
+
+    return json.loads(data)
+
+
+def _json_dumps(obj: types.Any) -> bytes:
+    """Serializes an object to UTF-8 encoded JSON.
+    """
+
+    if orjson is not None:
+        return orjson.dumps(obj)
+
+    return bytes(json.dumps(obj), "utf-8")
+
+
+def _http_session() -> requests.Session:
+    """Produces a `requests.Session` that keeps connections alive in a pool
+    and retries requests that fail due to transient server errors.
+    """
+
+    retry = Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=50, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return session
+
+
+# Shared by all requests to the Person API so that TCP and TLS connections
+# are reused between lookups rather than established for every request.
+_HTTP = _http_session()
+
+
 # We define some types to serve as 'interfaces' that can be referenced for
 # higher level functions and testing purposes.
 # This module defines implementations of each interface.
@@ -188,13 +350,15 @@ Token = str
 Username = str
 AuthInterface = types.Callable[[Url, AuthParams], types.Optional[Token]]
 UserByNameInterface = types.Callable[[Url, Token, Username], types.Optional[User]]
+UserLookupInterface = types.Callable[[Username], types.Optional[User]]
 DiscoveryInterface = types.Callable[[], types.List[LambdaFunction]]
 DispatchInterface = types.Callable[[AlertTriageRequest, str], DispatchResult]
 
 # Supported alerts have functions that can process those alerts along with a
-# configuration and OAuth token to produce an `AlertTriageRequest`.
+# configuration and a means of looking up user profiles to produce an
+# `AlertTriageRequest`.
 RequestBuilderInterface = types.Callable[
-    [dict, Config, str],
+    [dict, Config, UserLookupInterface],
     types.Optional[AlertTriageRequest]]
 
 
@@ -207,23 +371,83 @@ class message(object):
         the action can be run against.
         """
 
-        with open(CONFIG_FILE) as cfg_file:
-            self._config = Config(**json.load(cfg_file))
+        with open(CONFIG_FILE, "rb") as cfg_file:
+            config = Config(**_json_loads(cfg_file.read()))
+
+        # Static AWS credentials are only used if they are configured.
+        # Otherwise boto resolves credentials through its default provider
+        # chain (environment, instance profile, etc.) and refreshes them.
+        credentials = {}
+        key_id = config.aws_access_key_id
+        secret_key = config.aws_secret_access_key
+
+        if key_id and secret_key:
+            credentials = {
+                "aws_access_key_id": key_id,
+                "aws_secret_access_key": secret_key,
+            }
+        elif key_id or secret_key:
+            logger.warning(
+                "Only one of aws_access_key_id and aws_secret_access_key is "
+                "configured.  Ignoring it and using the default AWS "
+                "credential provider chain instead."
+            )
 
         # The Boto session does not need to be renewed manually.
         self._boto_session = boto3.session.Session(
-            region_name=self._config.aws_region,
-            aws_access_key_id=self._config.aws_access_key_id,
-            aws_secret_access_key=self._config.aws_secret_access_key,
+            region_name=config.aws_region,
+            **credentials,
         )
 
+        # Creating a client is expensive, so we create each one up front.
+        self._dispatch_to_lambda = _dispatcher(self._boto_session)
+        self._discover_lambda_fns = _discovery(self._boto_session)
+
         self._rest_api_cfg = RESTConfig(
-            url=self._config.mozdef_restapi_url,
-            token=self._config.mozdef_restapi_token,
+            url=config.mozdef_restapi_url,
+            token=config.mozdef_restapi_token,
         )
 
+        # Token refreshes only read these attributes, never the config.  Note
+        # that `AuthParams` holds the Person API client secret in memory for
+        # as long as the action runs, since every refresh needs it.
+        self._auth_params = AuthParams(
+            client_id=config.person_api_client_id,
+            client_secret=config.person_api_client_secret,
+            audience=config.person_api_audience,
+            scope=config.person_api_scope,
+            grants=config.person_api_grants,
+        )
+        self._oauth_url = config.oauth_url
+        self._token_validity_seconds = config.token_validity_window_minutes * 60
+
+        # The config kept by the action drops the credentials handed to the
+        # boto session and `AuthParams` above, so that it holds no second copy
+        # of them.  Every alert is checked against the enabled classnames, so we
+        # want those checks to be hash lookups.
+        self._config = config._replace(
+            enabled_alert_classnames=frozenset(config.enabled_alert_classnames),
+            aws_access_key_id=None,
+            aws_secret_access_key=None,
+            person_api_client_id=None,
+            person_api_client_secret=None,
+        )
+
+        # Guards the OAuth token, which is refreshed by a background thread.
+        self._lock = threading.Lock()
+
+        self._user_cache = UserCache()
+
         logger.debug("Performing initial OAuth Handshake")
         self._oauth_handshake()
+
+        refresher = threading.Thread(
+            target=self._refresh_oauth_token,
+            name="triage-bot-oauth-refresh",
+            daemon=True,
+        )
+        refresher.start()
+
         logger.debug("Performing initial Lambda function discovery")
         self._discover_lambda_fn()
 
@@ -236,106 +460,174 @@ class message(object):
 
     def onMessage(self, alert):
         """The main entrypoint to the alert action invoked with an alert.
+
+        Triage is performed before returning, since the alert is acknowledged
+        as soon as this method returns.
         """
 
-        request = try_make_outbound(
-            alert, self._config, self._person_api_session
-        )
+        if is_handled(alert, self._config):
+            self._triage(alert)
 
-        # Refresh our oauth token periodically.
-        delta = datetime.now() - self._last_authenticated
-        mins_since_auth = delta.total_seconds() / 60.0
+        return alert
+
+    def _triage(self, alert):
+        """Looks up the user responsible for an alert already determined to be
+        handled by the action and dispatches a request to the triage bot.
+        """
+
+        try:
+            builder = _request_builder(alert["_source"]["classname"])
+            request = builder(alert, self._config, self._primary_username)
 
-        have_request = request is not None
-        should_refresh = mins_since_auth >\
-            self._config.token_validity_window_minutes
+            if request is None:
+                return
 
-        if have_request and should_refresh:
-            self._oauth_handshake()
-            logger.debug("Performed OAuth handshake")
+            self._dispatch(request)
+        except Exception:
+            logger.exception("Failed to triage alert")
 
+    def _dispatch(self, request: AlertTriageRequest):
         # Re-discover the lambda function name to invoke periodically.
-        last_discovery = (datetime.now() - self._last_discovery).total_seconds()
-        if last_discovery > self._config.l_fn_name_validity_window_seconds:
+        if time.monotonic() >= self._discovery_expires_at:
             self._discover_lambda_fn()
             logger.debug("Discovered Lambda function name")
 
-        dispatch = _dispatcher(self._boto_session)
+        logger.debug("Attempting to dispatch request")
+        logger.debug(
+            "Alert {} triggered by {}".format(request.alert.value, request.user)
+        )
 
-        if have_request:
-            logger.debug("Attempting to dispatch request")
-            logger.debug(
-                "Alert {} triggered by {}".format(request.alert.value, request.user)
-            )
+        # Do not dispatch messages so that they go to a user on Slack if we
+        # end up appending to a duplicate chain.  This is how we avoid spam.
+        should_dispatch = True
 
-            # Do not dispatch messages so that they go to a user on Slack if we
-            # end up appending to a duplicate chain.  This is how we avoid spam.
+        try:
+            logger.debug("Fetching duplicate chain")
+            chain = _retrieve_duplicate_chain(
+                self._rest_api_cfg, request.alert, request.user
+            )
+            if chain is None:
+                logger.debug("Creating duplicate chain")
+                operation = _create_duplicate_chain
+            else:
+                logger.debug("Updating duplicate chain")
+                operation = _update_duplicate_chain
+                should_dispatch = False
+
+            operation(
+                self._rest_api_cfg,
+                request.alert,
+                request.user,
+                [request.identifier],
+            )
+        except APIError as err:
+            # In the case that we fail to maintain a duplicate chain,
+            # we should default to messaging users even at the risk of being
+            # noisy, as doing so is a useful indication of failure.
+            logger.exception(
+                "Duplicate chain management error: {}".format(err.message),
+            )
             should_dispatch = True
 
-            try:
-                logger.debug("Fetching duplicate chain")
-                chain = _retrieve_duplicate_chain(
-                    self._rest_api_cfg, request.alert, request.user
-                )
-                if chain is None:
-                    logger.debug("Creating duplicate chain")
-                    operation = _create_duplicate_chain
-                else:
-                    logger.debug("Updating duplicate chain")
-                    operation = _update_duplicate_chain
-                    should_dispatch = False
-
-                operation(
-                    self._rest_api_cfg,
-                    request.alert,
-                    request.user,
-                    [request.identifier],
-                )
-            except APIError as err:
-                # In the case that we fail to maintain a duplicate chain,
-                # we should default to messaging users even at the risk of being
-                # noisy, as doing so is a useful indication of failure.
-                logger.exception(
-                    "Duplicate chain management error: {}".format(err.message),
-                )
-                should_dispatch = True
-
-            if should_dispatch:
-                result = dispatch(request, self._lambda_function_name)
-
-                # In the case that dispatch fails, attempt to re-discover the name
-                # of the lambda function to invoke in case it was replaced.
-                if result != DispatchResult.SUCCESS:
-                    logger.error("Failed to dispatch request")
-                    reset = timedelta(
-                        seconds=self._config.l_fn_name_validity_window_seconds,
-                    )
-                    self._last_discovery = datetime.now() - reset
+        if should_dispatch:
+            result = self._dispatch_to_lambda(request, self._lambda_function_name)
 
-        return alert
+            # In the case that dispatch fails, attempt to re-discover the name
+            # of the lambda function to invoke in case it was replaced.
+            if result != DispatchResult.SUCCESS:
+                logger.error("Failed to dispatch request")
+                self._discovery_expires_at = time.monotonic()
 
     def _oauth_handshake(self):
-        self._person_api_session = authenticate(
-            self._config.oauth_url,
-            AuthParams(
-                client_id=self._config.person_api_client_id,
-                client_secret=self._config.person_api_client_secret,
-                audience=self._config.person_api_audience,
-                scope=self._config.person_api_scope,
-                grants=self._config.person_api_grants,
-            ),
-        )
+        tkn = authenticate(self._oauth_url, self._auth_params)
 
-        if self._person_api_session is None:
+        if tkn is None:
             logger.error("Failed to establish OAuth session")
             raise AuthFailure()
 
-        self._last_authenticated = datetime.now()
+        with self._lock:
+            self._person_api_session = tkn
+            self._token_expires_at =\
+                time.monotonic() + self._token_validity_seconds
+
+    def _refresh_oauth_token(self):
+        """Runs in a background thread, refreshing the OAuth token shortly
+        before it is due to expire so that `onMessage` never has to.
+        """
+
+        while True:
+            with self._lock:
+                wait = self._token_expires_at - time.monotonic()
+
+            time.sleep(max(
+                wait - TOKEN_REFRESH_MARGIN_SECONDS,
+                MIN_TOKEN_REFRESH_INTERVAL_SECONDS,
+            ))
+
+            # Any error is caught so that this thread keeps running.  We try
+            # again after the minimum interval, and lookups will still attempt
+            # an inline refresh if the Person API rejects the token.
+            try:
+                self._oauth_handshake()
+                logger.debug("Performed OAuth handshake")
+            except Exception:
+                logger.exception("Background OAuth token refresh failed")
+
+    def _primary_username(self, uname: Username) -> types.Optional[User]:
+        """A `UserLookupInterface` that serves profiles from the user cache
+        where possible, falling back to the Person API.
+        """
+
+        found, profile = self._user_cache.get(uname)
+
+        if found:
+            return profile
+
+        return self._fetch_and_cache(uname)
+
+    def _fetch_and_cache(self, uname: Username) -> types.Optional[User]:
+        try:
+            profile = self._fetch_user(uname)
+        except (Unauthorized, AuthFailure, LookupFailure):
+            # Only answers from the Person API are cached.  Failing to get an
+            # answer says nothing about whether the user exists.
+            logger.exception("Failed to look up user {}".format(uname))
+            return None
+
+        self._user_cache.put(uname, profile)
+
+        return profile
+
+    def _fetch_user(self, uname: Username) -> types.Optional[User]:
+        """Retrieves a user profile using `primary_username`, refreshing the
+        OAuth token inline and retrying exactly once in the case that it is
+        rejected.
+
+        Raises `Unauthorized`, `AuthFailure` or `LookupFailure` in the case
+        that the Person API could not be asked about the user.
+        """
+
+        try:
+            return primary_username(
+                self._config.person_api_base, self._current_token(), uname
+            )
+        except Unauthorized:
+            logger.debug("Person API rejected OAuth token, refreshing")
+
+        self._oauth_handshake()
+
+        return primary_username(
+            self._config.person_api_base, self._current_token(), uname
+        )
+
+    def _current_token(self) -> Token:
+        with self._lock:
+            return self._person_api_session
 
     def _discover_lambda_fn(self):
         functions = [
             function
-            for function in _discovery(self._boto_session)()
+            for function in self._discover_lambda_fns()
             if function.name.startswith(
                 self._config.slack_bot_function_name_prefix
             )
@@ -347,29 +639,44 @@ class message(object):
 
         self._lambda_function_name = functions[0].name
 
-        self._last_discovery = datetime.now()
+        self._discovery_expires_at = time.monotonic() +\
+            self._config.l_fn_name_validity_window_seconds
 
 
 def try_make_outbound(
-    alert: Alert, cfg: Config, oauth_tkn: Token
+    alert: Alert,
+    cfg: Config,
+    oauth_tkn: Token,
+    lookup: types.Optional[UserLookupInterface] = None,
 ) -> types.Optional[AlertTriageRequest]:
     """Attempt to determine the kind of alert contained in `alert` in
     order to produce an `AlertTriageRequest` destined for the web server comp.
+
+    User profiles are retrieved via `lookup` if provided, or else directly from
+    the Person API using `oauth_tkn`.
     """
 
-    _source = alert.get("_source", {})
+    if not is_handled(alert, cfg):
+        return None
 
-    alert_class_name = _source.get('classname')
+    if lookup is None:
+        lookup = _token_lookup(cfg.person_api_base, oauth_tkn)
 
-    if alert_class_name is None:
-        return None
+    builder = _request_builder(alert["_source"]["classname"])
+
+    return builder(alert, cfg, lookup)
 
-    builder = _request_builder(alert_class_name)
 
-    if alert_class_name in cfg.enabled_alert_classnames:
-        return builder(alert, cfg, oauth_tkn)
+def is_handled(alert: Alert, cfg: Config) -> bool:
+    """Determine whether `alert` is of a kind that the triage bot supports and
+    has been enabled for.  This is cheap, so that the majority of alerts,
+    which we do not handle, can be discarded before doing anything else.
+    """
+
+    alert_class_name = alert.get("_source", {}).get("classname")
 
-    return None
+    return alert_class_name in cfg.enabled_alert_classnames and\
+        alert_class_name in _SUPPORTED_ALERTS
 
 
 def authenticate(url: Url, params: AuthParams) -> types.Optional[Token]:
@@ -387,11 +694,16 @@ def authenticate(url: Url, params: AuthParams) -> types.Optional[Token]:
     }
 
     try:
-        resp = requests.post(url, json=payload)
-        return resp.json().get("access_token")
-    except:
+        resp = _HTTP.post(url, json=payload, timeout=PERSON_API_TIMEOUT)
+        data = _json_loads(resp.content)
+    except (requests.exceptions.RequestException, ValueError):
         return None
 
+    if not isinstance(data, dict):
+        return None
+
+    return data.get("access_token")
+
 
 def primary_username(base: Url, tkn: Token, uname: Username) -> types.Optional[User]:
     """An `UserByNameInterface` that uses the `requests` library to make a GET
@@ -402,8 +714,13 @@ def primary_username(base: Url, tkn: Token, uname: Username) -> types.Optional[U
     `https://person.api.com`.  This function will invoke the appropriate route.
 
     `tkn` must be an authenticated session token produced by an `AuthInterface`.
+    If the Person API rejects the token, `Unauthorized` is raised.
 
     `uname` is the string username of the user whose account to retrieve.
+
+    `None` is returned if the user does not exist or their profile is missing
+    fields.  If the Person API cannot be reached, responds with any other
+    error or does not respond with a JSON object, `LookupFailure` is raised.
     """
 
     route = "/v2/user/primary_username/{}".format(uname)
@@ -412,39 +729,102 @@ def primary_username(base: Url, tkn: Token, uname: Username) -> types.Optional[U
     headers = {"Authorization": "Bearer {}".format(tkn)}
 
     try:
-        resp = requests.get(full_url, headers=headers)
-    except requests.exceptions.RequestException:
+        resp = _HTTP.get(full_url, headers=headers, timeout=PERSON_API_TIMEOUT)
+    except requests.exceptions.RequestException as ex:
+        raise LookupFailure("Failed to make request: {}".format(ex))
+
+    if resp.status_code == 401:
+        raise Unauthorized()
+
+    if resp.status_code == 404:
         return None
 
-    data = resp.json()
+    if resp.status_code != 200:
+        raise LookupFailure(
+            "Person API responded with status {}".format(resp.status_code)
+        )
 
+    # Anything other than a JSON object, such as an error page served by a
+    # proxy, is not an answer from the Person API about the user.
     try:
-        created = datetime.strptime(
-            data.get("created", {}).get("value", ""), "%Y-%m-%dT%H:%M:%S.%fZ"
-        )
+        data = _json_loads(resp.content)
     except ValueError:
-        return None
+        raise LookupFailure("Person API responded with malformed JSON")
 
-    ldap_email = data["identities"]["mozilla_ldap_primary_email"].get("value")
-    if ldap_email is None:
+    if not isinstance(data, dict):
+        raise LookupFailure("Person API responded with a non-object body")
+
+    try:
+        created = _parse_timestamp(data.get("created", {}).get("value", ""))
+        ldap_email = data["identities"]["mozilla_ldap_primary_email"].get("value")
+
+        if ldap_email is None:
+            return None
+
+        return User(
+            created=created,
+            first_name=data["first_name"].get("value", "N/A"),
+            last_name=data["last_name"].get("value", "N/A"),
+            alternative_name=data["alternative_name"].get("value", "N/A"),
+            primary_email=data["primary_email"].get("value", "N/A"),
+            mozilla_ldap_primary_email=ldap_email,
+        )
+    except (ValueError, KeyError, AttributeError, TypeError):
+        # The profile is not shaped the way we expect.
         return None
 
-    return User(
-        created=created,
-        first_name=data["first_name"].get("value", "N/A"),
-        last_name=data["last_name"].get("value", "N/A"),
-        alternative_name=data["alternative_name"].get("value", "N/A"),
-        primary_email=data["primary_email"].get("value", "N/A"),
-        mozilla_ldap_primary_email=ldap_email,
+
+def _parse_timestamp(ts: str) -> datetime:
+    """Parses a timestamp in the fixed `%Y-%m-%dT%H:%M:%S.%fZ` format used by
+    the Person API, raising `ValueError` if it is malformed.
+
+    Slicing out each field is much cheaper than `datetime.strptime`, which has
+    to interpret its format string on every call.
+    """
+
+    frac = ts[20:-1]
+    well_formed = (
+        len(ts) >= 22 and
+        ts[4] == "-" and ts[7] == "-" and ts[10] == "T" and
+        ts[13] == ":" and ts[16] == ":" and ts[19] == "." and
+        ts[-1] == "Z" and
+        len(frac) <= 6 and frac.isdigit()
+    )
+
+    if not well_formed:
+        raise ValueError("Unexpected timestamp format: {}".format(ts))
+
+    return datetime(
+        int(ts[0:4]),
+        int(ts[5:7]),
+        int(ts[8:10]),
+        int(ts[11:13]),
+        int(ts[14:16]),
+        int(ts[17:19]),
+        int(frac.ljust(6, "0")),
     )
 
 
+def _token_lookup(base: Url, tkn: Token) -> UserLookupInterface:
+    """Produces a `UserLookupInterface` that retrieves user profiles from the
+    Person API at `base` using a fixed OAuth token.
+    """
+
+    def lookup(uname: Username) -> types.Optional[User]:
+        try:
+            return primary_username(base, tkn, uname)
+        except (Unauthorized, LookupFailure):
+            return None
+
+    return lookup
+
+
 def _discovery(boto_session) -> DiscoveryInterface:
     """Produces a function that, when called, retrieves a list of descriptions
     of AWS Lambda functions visible to the owner of the session provided.
     """
 
-    lambda_ = boto_session.client("lambda")
+    lambda_ = boto_session.client("lambda", config=LAMBDA_CLIENT_CONFIG)
 
     def discover() -> types.List[LambdaFunction]:
         payload = {}
@@ -476,27 +856,33 @@ def _discovery(boto_session) -> DiscoveryInterface:
     return discover
 
 
-def _dispatcher(boto_session) -> DispatchInterface:
+def _dispatcher(boto_session, invocation_type: str = "Event") -> DispatchInterface:
     """Produces a function that, when called, dispatches an
     `AlertTriageRequest` to an AWS Lambda function identified by the provided
     function name.
+
+    By default, the function is invoked asynchronously so that dispatch does
+    not wait for it to run.  AWS responds with a 202 status once the request
+    is queued and reports the outcome via the function's configured Lambda
+    Destinations.  Callers that need a reply can pass an `invocation_type` of
+    `"RequestResponse"` instead.
     """
 
-    lambda_ = boto_session.client("lambda")
+    lambda_ = boto_session.client("lambda", config=LAMBDA_CLIENT_CONFIG)
 
     def dispatch(req: AlertTriageRequest, fn_name: str) -> DispatchResult:
-        payload_dict = dict(req._asdict())
-        payload_dict["alert"] = req.alert.value
-        payload_dict["identityConfidence"] = req.identityConfidence.value
-
-        payload = bytes(json.dumps(payload_dict), "utf-8")
+        payload = req.to_bytes()
 
         status = 200
 
         try:
-            resp = lambda_.invoke(FunctionName=fn_name, Payload=payload)
+            resp = lambda_.invoke(
+                FunctionName=fn_name,
+                InvocationType=invocation_type,
+                Payload=payload,
+            )
             status = resp.get("StatusCode", 400)
-        except:
+        except (botocore.exceptions.BotoCoreError, botocore.exceptions.ClientError):
             status = 500
 
         if status >= 400:
@@ -510,7 +896,7 @@ def _dispatcher(boto_session) -> DispatchInterface:
 
 
 def _make_sensitive_host_access(
-    alert: Alert, cfg: Config, tkn: Token
+    alert: Alert, cfg: Config, lookup: UserLookupInterface
 ) -> types.Optional[AlertTriageRequest]:
     null = {
         "documentsource": {
@@ -531,7 +917,7 @@ def _make_sensitive_host_access(
         return None
 
     confidence = Confidence.HIGHEST
-    profile = primary_username(cfg.person_api_base, tkn, user)
+    profile = lookup(user)
 
     if profile is None:
         profile = User(
@@ -546,9 +932,9 @@ def _make_sensitive_host_access(
         confidence = Confidence.LOW
 
     summary = (
-        "An SSH session to a potentially sensitive host {} was made "
+        f"An SSH session to a potentially sensitive host {host} was made "
         "by your user account."
-    ).format(host)
+    )
 
     return AlertTriageRequest(
         alert["_id"],
@@ -560,7 +946,7 @@ def _make_sensitive_host_access(
 
 
 def _make_duo_code_gen(
-    alert: Alert, cfg: Config, tkn: Token
+    alert: Alert, cfg: Config, lookup: UserLookupInterface
 ) -> types.Optional[AlertTriageRequest]:
     null = {"documentsource": {"details": {"object": None}}}
 
@@ -587,7 +973,7 @@ def _make_duo_code_gen(
 
 
 def _make_duo_code_used(
-    alert: Alert, cfg: Config, tkn: Token
+    alert: Alert, cfg: Config, lookup: UserLookupInterface
 ) -> types.Optional[AlertTriageRequest]:
     null = {"documentsource": {"details": {"object": None}}}
 
@@ -615,21 +1001,21 @@ def _make_duo_code_used(
 
 
 def _make_ssh_access_releng(
-    alert: Alert, cfg: Config, tkn: Token
+    alert: Alert, cfg: Config, lookup: UserLookupInterface
 ) -> types.Optional[AlertTriageRequest]:
     null = {"documentsource": {"details": {"hostname": None}}}
 
     _source = alert.get("_source", {})
     _events = _source.get("events", [null])
 
-    user = _source.get("summary", "").split(" ")[-1]
+    user = _source.get("summary", "").rsplit(" ", 1)[-1]
     host = _events[0]["documentsource"]["details"]["hostname"]
 
     if user == "" or host is None or host == "":
         return None
 
     confidence = Confidence.HIGH
-    profile = primary_username(cfg.person_api_base, tkn, user)
+    profile = lookup(user)
 
     if profile is None:
         profile = User(
@@ -643,9 +1029,7 @@ def _make_ssh_access_releng(
 
         confidence = Confidence.LOW
 
-    summary = (
-        "An SSH session was established to host {} by your user " "account."
-    ).format(host)
+    summary = f"An SSH session was established to host {host} by your user account."
 
     return AlertTriageRequest(
         alert["_id"],
@@ -673,7 +1057,9 @@ def _retrieve_duplicate_chain(
         jwt_auth.set_header_format("Bearer %s")
 
     try:
-        resp = requests.get(url, params=payload, auth=jwt_auth)
+        resp = requests.get(
+            url, params=payload, auth=jwt_auth, timeout=REST_API_TIMEOUT
+        )
         resp_data = resp.json()
     except json.JSONDecodeError as ex:
         raise APIError("Did not receive JSON response: {}".format(ex))
@@ -722,7 +1108,9 @@ def _create_duplicate_chain(
         jwt_auth.set_header_format("Bearer %s")
 
     try:
-        resp = requests.post(url, json=payload, auth=jwt_auth)
+        resp = requests.post(
+            url, json=payload, auth=jwt_auth, timeout=REST_API_TIMEOUT
+        )
     except requests.exceptions.RequestException as ex:
         raise APIError("Failed to make request: {}".format(ex))
 
@@ -752,7 +1140,9 @@ def _update_duplicate_chain(
         jwt_auth.set_header_format("Bearer %s")
 
     try:
-        resp = requests.put(url, json=payload, auth=jwt_auth)
+        resp = requests.put(
+            url, json=payload, auth=jwt_auth, timeout=REST_API_TIMEOUT
+        )
     except requests.exceptions.RequestException as ex:
         raise APIError("Failed to make request: {}".format(ex))
 
@@ -764,20 +1154,17 @@ def _update_duplicate_chain(
     return True
 
 
-def _request_builder(alert_classname: str) -> RequestBuilderInterface:
-    # Note that the alert action will convert classnames to lowercase, so
-    # classnames in a config's `enabled_alert_classnames` must be provided
-    # as they appear below.
-    SUPPORTED_ALERTS = {
-        'AlertGenericLoader:ssh_open_crit': _make_sensitive_host_access,
-        'AlertAuthSignRelengSSH': _make_ssh_access_releng,
-        'AlertGenericLoader:duosecurity_bypass_generated': _make_duo_code_gen,
-        'AlertGenericLoader:duosecurity_bypass_used': _make_duo_code_used,
-    }
+# Note that the alert action will convert classnames to lowercase, so
+# classnames in a config's `enabled_alert_classnames` must be provided
+# as they appear below.
+_SUPPORTED_ALERTS = {
+    'AlertGenericLoader:ssh_open_crit': _make_sensitive_host_access,
+    'AlertAuthSignRelengSSH': _make_ssh_access_releng,
+    'AlertGenericLoader:duosecurity_bypass_generated': _make_duo_code_gen,
+    'AlertGenericLoader:duosecurity_bypass_used': _make_duo_code_used,
+}
 
-    # A `RequestBuilderInterface` can return `None` to indicate that it failed
-    # to process a request, so having this function return `None` directly
-    # actually creates unnecessary error handling.
-    return SUPPORTED_ALERTS.get(
-        alert_classname,
-        lambda _alert, _config, _token: None)
+
+def _request_builder(alert_classname: str) -> RequestBuilderInterface:
+    # Callers check `is_handled` first, so the classname is always supported.
+    return _SUPPORTED_ALERTS[alert_classname]
@@ -1,7 +1,10 @@
+from datetime import datetime
 import json
 
 import alerts.actions.triage_bot as bot
 
+import botocore.exceptions
+import mock
 import requests_mock
 
 
@@ -304,6 +307,46 @@ def _person_api_profile():
     }
 
 
+def _action_config():
+    return {
+        "enabled_alert_classnames": [
+            "AlertGenericLoader:ssh_open_crit",
+            "AlertAuthSignRelengSSH",
+            "AlertGenericLoader:duosecurity_bypass_generated",
+            "AlertGenericLoader:duosecurity_bypass_used",
+        ],
+        "oauth_url": "http://auth.api.com/oauth/token",
+        "person_api_base": "http://person.api.com",
+        "person_api_audience": "api.sso.mozilla.com",
+        "person_api_scope": "display:all",
+        "person_api_grants": "client_credentials",
+        "token_validity_window_minutes": 1080,
+        "person_api_client_id": "clientid",
+        "person_api_client_secret": "clientsecret",
+        "slack_bot_function_name_prefix": "test",
+        "l_fn_name_validity_window_seconds": 86400,
+        "aws_access_key_id": "",
+        "aws_secret_access_key": "",
+        "aws_region": "us-west-2",
+        "aws_lambda_function": "test_fn",
+        "mozdef_restapi_url": "http://mozdef.restapi.com",
+        "mozdef_restapi_token": "testtoken",
+    }
+
+
+def _make_action(tmpdir, boto_session):
+    """Constructs the alert action with a config written to `tmpdir` and a
+    mock boto session.  Requests to the Person API must already be mocked.
+    """
+
+    cfg_file = tmpdir.join("triage_bot.json")
+    cfg_file.write(json.dumps(_action_config()))
+
+    with mock.patch.object(bot, "CONFIG_FILE", str(cfg_file)):
+        with mock.patch("boto3.session.Session", return_value=boto_session):
+            return bot.message()
+
+
 class TestAlertRecognition(object):
     """Unit tests for the triage bot alert plugin.
     """
@@ -328,12 +371,25 @@ class TestAlertRecognition(object):
 
         assert result is None
 
+    def test_declines_disabled_alert(self):
+        msg = _ssh_sensitive_host_alert()
+        cfg = self.mock_config._replace(
+            enabled_alert_classnames=["AlertAuthSignRelengSSH"],
+        )
+
+        assert not bot.is_handled(msg, cfg)
+        assert bot.try_make_outbound(msg, cfg, "") is None
+
     def test_recognizes_ssh_sensitive_host(self):
         msg = _ssh_sensitive_host_alert()
 
         result = bot.try_make_outbound(msg, self.mock_config, "")
 
         assert result is not None
+        assert result.summary == (
+            "An SSH session to a potentially sensitive host a.host.website.com "
+            "was made by your user account."
+        )
 
     def test_recognizes_duo_bypass_codes_generated(self):
         msg = _duo_bypass_code_gen_alert()
@@ -355,6 +411,10 @@ class TestAlertRecognition(object):
         result = bot.try_make_outbound(msg, self.mock_config, "")
 
         assert result is not None
+        assert result.summary == (
+            "An SSH session was established to host releng.website.com by "
+            "your user account."
+        )
 
 
 class TestPersonAPI:
@@ -393,6 +453,22 @@ class TestPersonAPI:
 
             assert tkn is None
 
+    def test_authenticate_handles_non_object_response(self):
+        params = bot.AuthParams(
+            client_id="testid",
+            client_secret="secret",
+            audience="wonderful",
+            scope="client:read",
+            grants="read_acccess",
+        )
+
+        with requests_mock.mock() as mock_http:
+            mock_http.post("http://person.api.com", json=["testtoken"])
+
+            tkn = bot.authenticate("http://person.api.com", params)
+
+            assert tkn is None
+
     def test_primary_username_handles_well_formed_responses(self):
         with requests_mock.mock() as mock_http:
             mock_http.get(
@@ -404,6 +480,7 @@ class TestPersonAPI:
                 "http://person.api.com", "testtoken", "testuser"
             )
 
+            assert profile.created == datetime(2019, 2, 27, 11, 23)
             assert profile.primary_email == "test@email.com"
             assert profile.first_name == "tester"
             assert profile.alternative_name == "testing"
@@ -420,6 +497,167 @@ class TestPersonAPI:
 
             assert profile is None
 
+    def test_primary_username_handles_malformed_profiles(self):
+        incomplete = _person_api_profile()
+        del incomplete["first_name"]
+
+        for body in [{}, {"created": "soon"}, incomplete]:
+            with requests_mock.mock() as mock_http:
+                mock_http.get(
+                    "http://person.api.com/v2/user/primary_username/testuser",
+                    json=body,
+                )
+
+                profile = bot.primary_username(
+                    "http://person.api.com", "testtoken", "testuser"
+                )
+
+                assert profile is None
+
+    def test_primary_username_raises_on_non_object_response(self):
+        responses = [
+            {"text": "<html>Bad Gateway</html>"},
+            {"json": ["not", "a", "profile"]},
+        ]
+
+        for response in responses:
+            with requests_mock.mock() as mock_http:
+                mock_http.get(
+                    "http://person.api.com/v2/user/primary_username/testuser",
+                    **response
+                )
+
+                try:
+                    bot.primary_username(
+                        "http://person.api.com", "testtoken", "testuser"
+                    )
+                except bot.LookupFailure:
+                    continue
+
+                assert False  # Shouldn't get here
+
+    def test_primary_username_handles_unknown_user(self):
+        with requests_mock.mock() as mock_http:
+            mock_http.get(
+                "http://person.api.com/v2/user/primary_username/testuser",
+                status_code=404,
+                json={"message": "Not Found"},
+            )
+
+            profile = bot.primary_username(
+                "http://person.api.com", "testtoken", "testuser"
+            )
+
+            assert profile is None
+
+    def test_primary_username_raises_on_server_error(self):
+        with requests_mock.mock() as mock_http:
+            mock_http.get(
+                "http://person.api.com/v2/user/primary_username/testuser",
+                status_code=500,
+                text="Internal Server Error",
+            )
+
+            try:
+                bot.primary_username(
+                    "http://person.api.com", "testtoken", "testuser"
+                )
+            except bot.LookupFailure:
+                return
+
+            assert False  # Shouldn't get here
+
+    def test_primary_username_raises_on_rejected_token(self):
+        with requests_mock.mock() as mock_http:
+            mock_http.get(
+                "http://person.api.com/v2/user/primary_username/testuser",
+                status_code=401,
+                json={"message": "Unauthorized"},
+            )
+
+            try:
+                bot.primary_username(
+                    "http://person.api.com", "expiredtoken", "testuser"
+                )
+            except bot.Unauthorized:
+                return
+
+            assert False  # Shouldn't get here
+
+
+class TestTimestampParsing:
+    def test_matches_strptime(self):
+        for ts in [
+            "2019-02-27T11:23:00.000Z",
+            "2020-12-31T23:59:59.123456Z",
+            "2001-01-01T00:00:00.5Z",
+        ]:
+            expected = datetime.strptime(ts, "%Y-%m-%dT%H:%M:%S.%fZ")
+
+            assert bot._parse_timestamp(ts) == expected
+
+    def test_rejects_malformed_timestamps(self):
+        for ts in [
+            "",
+            "2019-02-27",
+            "2019-02-27T11:23:00Z",
+            "2019-02-27 11:23:00.000Z",
+            "2019-02-27T11:23:00.000",
+            "2019-02-27T11:23:00.1234567Z",
+            "2019-13-27T11:23:00.000Z",
+        ]:
+            try:
+                bot._parse_timestamp(ts)
+            except ValueError:
+                continue
+
+            assert False, ts  # Shouldn't get here
+
+
+class TestUserCache:
+    def _profile(self):
+        return bot.User(
+            created=None,
+            first_name="tester",
+            last_name="mctestperson",
+            alternative_name="testing",
+            primary_email="test@email.com",
+            mozilla_ldap_primary_email="test@email.com",
+        )
+
+    def test_caches_profiles_and_failed_lookups(self):
+        cache = bot.UserCache()
+        profile = self._profile()
+
+        assert cache.get("tester") == (False, None)
+
+        cache.put("tester", profile)
+        cache.put("nobody", None)
+
+        assert cache.get("tester") == (True, profile)
+        assert cache.get("nobody") == (True, None)
+
+    def test_entries_expire(self):
+        cache = bot.UserCache(ttl=0, negative_ttl=0)
+
+        cache.put("tester", self._profile())
+        cache.put("nobody", None)
+
+        assert cache.get("tester") == (False, None)
+        assert cache.get("nobody") == (False, None)
+
+    def test_evicts_least_recently_used(self):
+        cache = bot.UserCache(max_size=2)
+
+        cache.put("first", self._profile())
+        cache.put("second", self._profile())
+        cache.get("first")
+        cache.put("third", self._profile())
+
+        assert cache.get("first")[0]
+        assert not cache.get("second")[0]
+        assert cache.get("third")[0]
+
 
 class TestLambda:
     class MockLambda:
@@ -428,6 +666,13 @@ class TestLambda:
 
         def invoke(self, **kwargs):
             self.session.calls["invoke"].append(kwargs)
+
+            if self.session.invoke_error is not None:
+                raise self.session.invoke_error
+
+            if kwargs.get("InvocationType") == "Event":
+                return {"StatusCode": 202}
+
             return {"StatusCode": 200}
 
         def list_functions(self, **kwargs):
@@ -451,8 +696,9 @@ class TestLambda:
     class MockSession:
         def __init__(self):
             self.calls = {"list_functions": [], "invoke": []}
+            self.invoke_error = None
 
-        def client(self, _service_name):
+        def client(self, _service_name, **_kwargs):
             return TestLambda.MockLambda(self)
 
     def test_discover(self):
@@ -483,6 +729,7 @@ class TestLambda:
         assert status == bot.DispatchResult.SUCCESS
         assert len(sess.calls["invoke"]) == 1
         assert sess.calls["invoke"][0]["FunctionName"] == "test_fn"
+        assert sess.calls["invoke"][0]["InvocationType"] == "Event"
         assert json.loads(sess.calls["invoke"][0]["Payload"]) == {
             "identifier": "abcdef0123",
             "alert": "ssh_access_sign_releng",
@@ -491,6 +738,25 @@ class TestLambda:
             "identityConfidence": "high",
         }
 
+    def test_dispatch_failure(self):
+        request = bot.AlertTriageRequest(
+            identifier="abcdef0123",
+            alert=bot.AlertLabel.SSH_ACCESS_SIGN_RELENG,
+            summary="test alert",
+            user="test@user.com",
+            identityConfidence=bot.Confidence.HIGH,
+        )
+
+        sess = TestLambda.MockSession()
+        sess.invoke_error = botocore.exceptions.ClientError(
+            {"Error": {"Code": "ResourceNotFoundException", "Message": ""}},
+            "Invoke",
+        )
+        dispatch = bot._dispatcher(sess)
+        status = dispatch(request, "test_fn")
+
+        assert status == bot.DispatchResult.FAILURE
+
 
 class TestDuplicateChainManagement:
     mock_api_base = "http://mozdef.restapi.com"
@@ -619,3 +885,167 @@ class TestDuplicateChainManagement:
                 return
 
             assert False  # Shouldn't get here
+
+
+class TestAlertAction:
+    oauth_url = "http://auth.api.com/oauth/token"
+    profile_url = "http://person.api.com/v2/user/primary_username/tester"
+
+    def test_fetch_user_refreshes_rejected_token_once(self, tmpdir):
+        with requests_mock.mock() as mock_http:
+            mock_http.post(self.oauth_url, json={"access_token": "testtoken"})
+
+            action = _make_action(tmpdir, TestLambda.MockSession())
+
+            mock_http.get(
+                self.profile_url,
+                [
+                    {"status_code": 401, "json": {"message": "Unauthorized"}},
+                    {"json": _person_api_profile()},
+                ],
+            )
+
+            profile = action._fetch_user("tester")
+
+            methods = [req.method for req in mock_http.request_history]
+
+        assert profile.primary_email == "test@email.com"
+        # The initial handshake, then the rejected lookup, a single refresh
+        # and a single retry.
+        assert methods == ["POST", "GET", "POST", "GET"]
+
+    def test_caches_unknown_users_but_not_failures(self, tmpdir):
+        unknown_url = "http://person.api.com/v2/user/primary_username/nobody"
+
+        with requests_mock.mock() as mock_http:
+            mock_http.post(self.oauth_url, json={"access_token": "testtoken"})
+
+            action = _make_action(tmpdir, TestLambda.MockSession())
+
+            profiles = mock_http.get(
+                self.profile_url,
+                [
+                    {"status_code": 503, "text": "Service Unavailable"},
+                    {"text": "<html>Proxy error</html>"},
+                    {"json": _person_api_profile()},
+                ],
+            )
+            unknown = mock_http.get(
+                unknown_url, status_code=404, json={"message": "Not Found"}
+            )
+
+            # Neither the outage nor the proxy's error page is cached, so each
+            # lookup tries again.
+            assert action._primary_username("tester") is None
+            assert action._primary_username("tester") is None
+            assert action._primary_username("tester") is not None
+            assert profiles.call_count == 3
+
+            # The user not existing is cached.
+            assert action._primary_username("nobody") is None
+            assert action._primary_username("nobody") is None
+            assert unknown.call_count == 1
+
+    def test_triages_and_dispatches_alerts(self, tmpdir):
+        chain_url = "http://mozdef.restapi.com/alerttriagechain"
+        no_chain = {"json": {"error": "Chain does not exist"}}
+        existing_chain = {
+            "json": {
+                "error": None,
+                "identifiers": ["jY29OGBBCfj908U9z3kd"],
+                "created": "2020-02-19T01:23:45+00:00",
+                "modified": "2020-02-19T01:23:45+00:00",
+            },
+        }
+
+        sess = TestLambda.MockSession()
+
+        with requests_mock.mock() as mock_http:
+            mock_http.post(self.oauth_url, json={"access_token": "testtoken"})
+
+            action = _make_action(tmpdir, sess)
+
+            profiles = mock_http.get(self.profile_url, json=_person_api_profile())
+            mock_http.get(chain_url, [no_chain, no_chain, existing_chain])
+            created = mock_http.post(chain_url, json={"error": None})
+            updated = mock_http.put(chain_url, json={"error": None})
+
+            unhandled = _ssh_sensitive_host_alert()
+            unhandled["_source"]["classname"] = "test"
+
+            alerts = [
+                _ssh_sensitive_host_alert(),
+                _duo_bypass_code_gen_alert(),
+                unhandled,
+                _ssh_sensitive_host_alert(),
+            ]
+
+            for alert in alerts:
+                assert action.onMessage(alert) is alert
+
+        # The second alert for the same user updates the existing duplicate
+        # chain rather than messaging the user again.
+        assert created.call_count == 2
+        assert updated.call_count == 1
+        assert profiles.call_count == 1
+
+        payloads = [json.loads(call["Payload"]) for call in sess.calls["invoke"]]
+
+        assert [call["FunctionName"] for call in sess.calls["invoke"]] ==\
+            ["test1", "test1"]
+        assert [payload["identifier"] for payload in payloads] ==\
+            ["jY29OGBBCfj908U9z3kd", "Rd8h4ukN9Ob7umH452xl"]
+        assert [payload["user"] for payload in payloads] ==\
+            ["test@email.com", "tester@website.com"]
+
+    def test_logs_triage_errors(self, tmpdir):
+        sess = TestLambda.MockSession()
+
+        with requests_mock.mock() as mock_http:
+            mock_http.post(self.oauth_url, json={"access_token": "testtoken"})
+
+            action = _make_action(tmpdir, sess)
+
+            mock_http.get(self.profile_url, json=_person_api_profile())
+
+            with mock.patch.object(
+                bot, "_retrieve_duplicate_chain", side_effect=RuntimeError
+            ):
+                alert = _ssh_sensitive_host_alert()
+
+                assert action.onMessage(alert) is alert
+
+        assert sess.calls["invoke"] == []
+
+    def test_warns_about_partial_aws_credentials(self, tmpdir):
+        config = _action_config()
+        config["aws_access_key_id"] = "accessid"
+        cfg_file = tmpdir.join("triage_bot.json")
+        cfg_file.write(json.dumps(config))
+
+        with requests_mock.mock() as mock_http:
+            mock_http.post(self.oauth_url, json={"access_token": "testtoken"})
+
+            with mock.patch.object(bot, "CONFIG_FILE", str(cfg_file)):
+                with mock.patch(
+                    "boto3.session.Session",
+                    return_value=TestLambda.MockSession(),
+                ) as session:
+                    with mock.patch.object(bot.logger, "warning") as warning:
+                        bot.message()
+
+        session.assert_called_once_with(region_name="us-west-2")
+        assert warning.call_count == 1
+
+    def test_config_does_not_keep_credentials(self, tmpdir):
+        with requests_mock.mock() as mock_http:
+            mock_http.post(self.oauth_url, json={"access_token": "testtoken"})
+
+            action = _make_action(tmpdir, TestLambda.MockSession())
+
+        assert isinstance(action._config.enabled_alert_classnames, frozenset)
+        assert action._config.aws_access_key_id is None
+        assert action._config.aws_secret_access_key is None
+        assert action._config.person_api_client_id is None
+        assert action._config.person_api_client_secret is None
+        assert action._auth_params.client_secret == "clientsecret"